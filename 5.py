@@ -1,20 +1,34 @@
+import asyncio
+import logging
 import os
+import time
+from typing import NoReturn
 from contextlib import asynccontextmanager
-from pydantic import BaseModel, Field, field_validator, EmailStr, FutureDatetime
+from pydantic import BaseModel, Field, field_validator, EmailStr, FutureDatetime, TypeAdapter, ValidationError
 import datetime
 import aiomysql
+import anyio
+import orjson
 import uvicorn
+from argon2 import PasswordHasher
+from pymysql.constants import CLIENT, ER
 from dotenv import load_dotenv
-from fastapi.responses import JSONResponse
-from fastapi import FastAPI, HTTPException, status, Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, status, Path, Query, Request
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 headers = {
     'Accept': 'application/json'
 }
 
 
+PASSWORD_SPECIALS = frozenset("!@#$%^&*()_-+=[]{}|\\:;\"'<>,.?/~`")
+
+
 class Book(BaseModel):
     """Base book model"""
     title: str = Field(max_length=50)
@@ -24,6 +38,10 @@ class Book(BaseModel):
     year: datetime.date
 
 
+# bulk bodies are validated straight from the raw JSON bytes, skipping the json.loads -> dict -> model detour
+BOOK_LIST_ADAPTER = TypeAdapter(list[Book])
+
+
 class Event(BaseModel):
     """Base event model"""
     title: str = Field(max_length=50)
@@ -41,32 +59,35 @@ class EventEdit(BaseModel):
 
 class User(BaseModel):
     """Base user model"""
-    name: str = Field(..., max_length=50, min_length=2)
-    surname: str = Field(..., max_length=50, min_length=2)
+    name: str = Field(..., max_length=50, min_length=2, pattern=r"^\D+$")
+    surname: str = Field(..., max_length=50, min_length=2, pattern=r"^\D+$")
     email: EmailStr = Field(...)
     password: str = Field(..., max_length=20, min_length=5)
     phone: str = Field(..., pattern=r"\+?\d{10,15}")
     is_admin: bool = Field(default=False)
 
-    @field_validator('name', 'surname', mode='before')
-    @classmethod
-    def check_letters(cls, value: str) -> str:
-        if any(char.isdigit() for char in value):
-            raise ValueError("Fields 'name' and 'surname' must not contain numbers")
-        return value
-
-    @field_validator('password', mode='before')
+    @field_validator('password')
     @classmethod
     def validate_password(cls, v: str) -> str:
-        if not any(c.islower() for c in v):
+        lower = upper = digit = special = False
+        for c in v:
+            if c.islower():
+                lower = True
+            elif c.isupper():
+                upper = True
+            elif c.isdigit():
+                digit = True
+            elif c in PASSWORD_SPECIALS:
+                special = True
+            if lower and upper and digit and special:
+                return v
+        if not lower:
             raise ValueError("Password must contain at least one lowercase letter")
-        if not any(c.isupper() for c in v):
+        if not upper:
             raise ValueError("Password must contain at least one uppercase letter")
-        if not any(c.isdigit() for c in v):
+        if not digit:
             raise ValueError("Password must contain at least one digit")
-        if not any(c in "!@#$%^&*()_-+=[]{}|\\:;\"'<>,.?/~`" for c in v):
-            raise ValueError("Password must contain at least one special character")
-        return v
+        raise ValueError("Password must contain at least one special character")
 
 
 MYSQL_CONNECTION_DATA = {
@@ -75,382 +96,523 @@ MYSQL_CONNECTION_DATA = {
     "user": os.environ.get("MYSQL_USER"),
     "password": os.environ.get("MYSQL_PASSWORD"),
     "db": os.environ.get("MYSQL_DB"),
+    # rowcount should report matched rows, not only changed ones, for the fused admin+write statements
+    "client_flag": CLIENT.FOUND_ROWS,
+    # members lists are built with GROUP_CONCAT, which MySQL silently truncates at 1024 bytes by default
+    "init_command": "SET SESSION group_concat_max_len = 1048576",
 }
 
-
-async def get_mysql_connection() -> aiomysql.Connection:
-    return await aiomysql.connect(**MYSQL_CONNECTION_DATA)
+# create_pool opens MYSQL_POOL_MIN connections before startup finishes, so the first requests skip the handshake
+MYSQL_POOL_MIN = int(os.environ.get("MYSQL_POOL_MIN", 5))
+MYSQL_POOL_MAX = int(os.environ.get("MYSQL_POOL_MAX", 32))
+
+
+PASSWORD_HASHER = PasswordHasher()
+
+# SQL text is kept in one place so every call sends byte-identical statements
+SQL_ADMIN_DENIAL = """
+    SELECT isadmin,
+           EXISTS(SELECT 1 FROM event WHERE id = %s),
+           EXISTS(SELECT 1 FROM users WHERE id = %s)
+      FROM users WHERE name = %s;
+"""
+SQL_INSERT_BOOK = """
+    INSERT INTO books (title, author, description, year, count)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+SQL_INSERT_EVENT = """
+    INSERT INTO event (title, user, description, time)
+    SELECT %s, %s, %s, %s FROM users WHERE name = %s AND isadmin = 1;
+"""
+SQL_INSERT_USER = """
+    INSERT INTO users (name, surname, email, phone, password, isadmin)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+# statements without parameters are pre-encoded; aiomysql sends bytes as-is instead of encoding per call
+SQL_SELECT_BOOKS = b"SELECT id, title, author, description, count, year FROM books;"
+SQL_SELECT_EVENTS = b"""
+    SELECT e.id, e.title, e.user, e.description, e.time, GROUP_CONCAT(m.member_id ORDER BY m.member_id) AS members
+      FROM event e LEFT JOIN event_members m ON m.event_id = e.id
+     GROUP BY e.id;
+"""
+SQL_SELECT_BOOKS_BY_ID = "SELECT * FROM books WHERE id IN ({});"
+SQL_SELECT_EVENTS_BY_ID = """
+    SELECT e.id, e.title, e.user, e.description, e.time, GROUP_CONCAT(m.member_id ORDER BY m.member_id) AS members
+      FROM event e LEFT JOIN event_members m ON m.event_id = e.id
+     WHERE e.id IN ({})
+     GROUP BY e.id;
+"""
+SQL_UPDATE_EVENT = """
+    UPDATE event e JOIN users u ON u.name = %s
+       SET e.title = %s, e.description = %s
+     WHERE e.id = %s AND u.isadmin = 1;
+"""
+SQL_RESCHEDULE_EVENT = """
+    UPDATE event e JOIN users u ON u.name = %s
+       SET e.time = %s
+     WHERE e.id = %s AND u.isadmin = 1;
+"""
+SQL_ADD_MEMBER = """
+    INSERT IGNORE INTO event_members (event_id, member_id)
+    SELECT e.id, u.id FROM event e JOIN users u ON u.id = %s
+     WHERE e.id = %s AND EXISTS(SELECT 1 FROM users WHERE name = %s AND isadmin = 1);
+"""
+SQL_DELETE_EVENT = """
+    DELETE e FROM event e JOIN users u ON u.name = %s AND u.isadmin = 1
+     WHERE e.id = %s;
+"""
+
+# MySQL has no CREATE INDEX IF NOT EXISTS, so create_tables skips the ones that already exist,
+# and unique ones that existing duplicate rows prevent from being built
+TABLE_INDEXES = (
+    "CREATE UNIQUE INDEX ix_users_email ON users (email);",
+    "CREATE INDEX ix_users_name_admin ON users (name, isadmin);",
+    "CREATE INDEX ix_event_time ON event (time);",
+)
+
+BOOK_COLUMNS = ("id", "title", "author", "description", "count", "year")
+EVENT_COLUMNS = ("id", "title", "user", "description", "time", "members")
+# rows pulled from an unbuffered cursor per streamed chunk
+STREAM_CHUNK_ROWS = 500
+
+# rows per multi-row INSERT in bulk endpoints
+BULK_INSERT_CHUNK = 10_000
+
+
+ADMIN_CACHE_TTL = 30
+ADMIN_CACHE_SIZE = 1024
+# names of users recently found not to be admins -> expiry on the monotonic clock
+_non_admin_cache: dict[str, float] = {}
+
+
+def remember_non_admin(user: str) -> None:
+    _non_admin_cache.pop(user, None)
+    if len(_non_admin_cache) >= ADMIN_CACHE_SIZE:
+        del _non_admin_cache[next(iter(_non_admin_cache))]
+    _non_admin_cache[user] = time.monotonic() + ADMIN_CACHE_TTL
+
+
+def deny_cached_non_admin(user: str, action: str) -> None:
+    """Reject a user recently found not to be an admin without going to the database"""
+    expires = _non_admin_cache.get(user)
+    if expires is None:
+        return
+    if expires < time.monotonic():
+        del _non_admin_cache[user]
+        return
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                        detail=f'User hasn`t permissions for {action} event')
+
+
+async def raise_admin_denial(cursor: aiomysql.Cursor, user: str, action: str,
+                             event_id: int | None = None, member_id: int | None = None) -> NoReturn:
+    """Explain why an admin-only write touched no rows"""
+    await cursor.execute(SQL_ADMIN_DENIAL, (event_id, member_id, user))
+    resp = await cursor.fetchone()
+    if resp is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
+    if not resp[0]:
+        remember_non_admin(user)
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail=f'User hasn`t permissions for {action} event')
+    if not resp[1] or member_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
+    if not resp[2]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found")
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Member already registed")
+
+
+class RowStream(StreamingResponse):
+    """Streams an unbuffered cursor as a JSON array and always hands its connection back to the pool"""
+
+    def __init__(self, pool: aiomysql.Pool, connection: aiomysql.Connection, cursor: aiomysql.SSCursor,
+                 columns: tuple[str, ...]):
+        self.pool = pool
+        self.connection = connection
+        self.cursor = cursor
+        self.completed = False
+        super().__init__(self._body(columns), media_type="application/json")
+
+    async def _body(self, columns: tuple[str, ...]):
+        yield b"["
+        separator = b""
+        while rows := await self.cursor.fetchmany(STREAM_CHUNK_ROWS):
+            yield separator + b",".join(orjson.dumps(dict(zip(columns, row))) for row in rows)
+            separator = b","
+        yield b"]"
+        self.completed = True
+
+    async def __call__(self, scope, receive, send) -> None:
+        # released here rather than in the generator, which never runs if sending the headers fails
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._release()
+
+    async def _release(self) -> None:
+        try:
+            if self.completed:
+                await self.cursor.close()
+            else:
+                # closing the cursor would read the rest of an abandoned result off the wire
+                self.connection.close()
+        except Exception:
+            self.connection.close()
+        finally:
+            await self.pool.release(self.connection)
 
 
-@asynccontextmanager
-async def create_tables(_: FastAPI):
-    """
-    Створення таблиць в БД при старті програми та закриття з'єднання з БД після завершення.
-    """
-    async with aiomysql.connect(**MYSQL_CONNECTION_DATA) as connection:
-        cursor: aiomysql.Cursor = await connection.cursor()
-        await cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS event (
-                id INT AUTO_INCREMENT,
-                title VARCHAR(50) NOT NULL,
-                user VARCHAR(50) NOT NULL,
-                description VARCHAR(200) NOT NULL,
-                members TEXT,
-                time DATETIME,
-                PRIMARY KEY(id)
-            );
-            """
-        )
-        await cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INT AUTO_INCREMENT,
-                name VARCHAR(50) NOT NULL UNIQUE,
-                surname VARCHAR(50) NOT NULL,
-                email VARCHAR(50) NOT NULL,
-                password VARCHAR(20) NOT NULL,
-                phone TEXT,
-                isadmin BOOLEAN,
-                PRIMARY KEY(id)
-            );
-            """
-        )
+async def stream_rows(pool: aiomysql.Pool, sql: bytes, columns: tuple[str, ...]) -> RowStream:
+    """Run `sql` on an unbuffered cursor and stream its rows as a JSON array of objects"""
+    connection = await pool.acquire()
+    try:
+        cursor = await connection.cursor(aiomysql.SSCursor)
+        await cursor.execute(sql)
+    except Exception:
+        connection.close()
+        await pool.release(connection)
+        raise
+    return RowStream(pool, connection, cursor, columns)
+
+
+class BatchLoader:
+    """Coalesces concurrent lookups by id into a single `WHERE id IN (...)` query"""
+
+    def __init__(self, pool: aiomysql.Pool, sql: str, max_batch: int = 256, delay: float = 0.001):
+        self.pool = pool
+        self.sql = sql
+        self.max_batch = max_batch
+        self.delay = delay
+        self._pending: dict[int, list[asyncio.Future]] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def load(self, key: int) -> dict | None:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.delay, self._dispatch)
+        return await future
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._fetch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, batch: dict[int, list[asyncio.Future]]) -> None:
+        try:
+            async with self.pool.acquire() as connection, connection.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(self.sql.format(", ".join(["%s"] * len(batch))), tuple(batch))
+                rows = {row["id"]: row for row in await cursor.fetchall()}
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for key, futures in batch.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(rows.get(key))
+
+
+# users columns that older schemas declared narrower -> minimum VARCHAR length
+USER_COLUMN_WIDTHS = (
+    # tables created before passwords were hashed have a column too narrow for an argon2 hash
+    ("password", 128),
+    # 254 characters is the longest valid email address
+    ("email", 254),
+)
+
+
+async def widen_user_columns(cursor: aiomysql.Cursor) -> None:
+    """Widen users columns left too narrow by older schemas, leaving wide enough ones untouched"""
+    for column, length in USER_COLUMN_WIDTHS:
         await cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS books (
-                id INT AUTO_INCREMENT,
-                title VARCHAR(50) NOT NULL,
-                author VARCHAR(50) NOT NULL,
-                description VARCHAR(200),
-                count INTEGER,
-                year DATE,
-                PRIMARY KEY(id)
-            );
-            """
+            SELECT CHARACTER_MAXIMUM_LENGTH FROM information_schema.columns
+             WHERE table_schema = DATABASE() AND table_name = 'users' AND column_name = %s;
+            """,
+            (column,)
         )
-        await connection.commit()
+        resp = await cursor.fetchone()
+        if resp is not None and resp[0] < length:
+            await cursor.execute(f"ALTER TABLE users MODIFY {column} VARCHAR({length}) NOT NULL;")
+
+
+async def migrate_event_members(cursor: aiomysql.Cursor) -> None:
+    """Move RSVPs from the legacy comma-separated event.members column into event_members"""
+    await cursor.execute(
+        """
+        SELECT 1 FROM information_schema.columns
+         WHERE table_schema = DATABASE() AND table_name = 'event' AND column_name = 'members';
+        """
+    )
+    if await cursor.fetchone() is None:
+        return
+    await cursor.execute("SELECT id FROM users;")
+    user_ids = {row[0] for row in await cursor.fetchall()}
+    await cursor.execute("SELECT id, members FROM event WHERE members IS NOT NULL AND members <> '';")
+    pairs = []
+    for event_id, members in await cursor.fetchall():
+        for member in members.split(","):
+            # the old RSVP code appended to str(None) for events created without a members value
+            member = member.strip().removeprefix("None")
+            if member.isdigit() and int(member) in user_ids:
+                pairs.append((event_id, int(member)))
+    if pairs:
+        # IGNORE makes a rerun after an interrupted migration harmless
+        await cursor.executemany("INSERT IGNORE INTO event_members (event_id, member_id) VALUES (%s, %s);", pairs)
+    await cursor.execute("ALTER TABLE event DROP COLUMN members;")
 
-    yield
+
+@asynccontextmanager
+async def create_tables(app: FastAPI):
+    """
+    Створення пулу з'єднань і таблиць в БД при старті програми та закриття пулу після завершення.
+    """
+    app.state.pool = await aiomysql.create_pool(
+        minsize=MYSQL_POOL_MIN, maxsize=MYSQL_POOL_MAX, autocommit=True, **MYSQL_CONNECTION_DATA
+    )
+    try:
+        app.state.book_loader = BatchLoader(app.state.pool, SQL_SELECT_BOOKS_BY_ID)
+        app.state.event_loader = BatchLoader(app.state.pool, SQL_SELECT_EVENTS_BY_ID)
+        async with app.state.pool.acquire() as connection, connection.cursor() as cursor:
+            await cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS event (
+                    id INT AUTO_INCREMENT,
+                    title VARCHAR(50) NOT NULL,
+                    user VARCHAR(50) NOT NULL,
+                    description VARCHAR(200) NOT NULL,
+                    time DATETIME,
+                    PRIMARY KEY(id)
+                );
+                """
+            )
+            await cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS users (
+                    id INT AUTO_INCREMENT,
+                    name VARCHAR(50) NOT NULL UNIQUE,
+                    surname VARCHAR(50) NOT NULL,
+                    email VARCHAR(254) NOT NULL,
+                    password VARCHAR(128) NOT NULL,
+                    phone TEXT,
+                    isadmin BOOLEAN,
+                    PRIMARY KEY(id)
+                );
+                """
+            )
+            await widen_user_columns(cursor)
+            await cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS books (
+                    id INT AUTO_INCREMENT,
+                    title VARCHAR(50) NOT NULL,
+                    author VARCHAR(50) NOT NULL,
+                    description VARCHAR(200),
+                    count INTEGER,
+                    year DATE,
+                    PRIMARY KEY(id)
+                );
+                """
+            )
+            await cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS event_members (
+                    event_id INT NOT NULL,
+                    member_id INT NOT NULL,
+                    PRIMARY KEY(event_id, member_id),
+                    FOREIGN KEY(event_id) REFERENCES event(id) ON DELETE CASCADE,
+                    FOREIGN KEY(member_id) REFERENCES users(id) ON DELETE CASCADE
+                );
+                """
+            )
+            await migrate_event_members(cursor)
+            for index in TABLE_INDEXES:
+                try:
+                    await cursor.execute(index)
+                except aiomysql.OperationalError as e:
+                    if e.args[0] != ER.DUP_KEYNAME:
+                        raise
+                except aiomysql.IntegrityError as e:
+                    # existing duplicates (e.g. two users sharing an email) must be cleaned up by hand first;
+                    # refusing to start over it would take the whole API down
+                    if e.args[0] != ER.DUP_ENTRY:
+                        raise
+                    logger.warning("Skipped %r: existing rows violate it (%s)", index, e.args[1])
+
+        yield
+    finally:
+        app.state.pool.close()
+        await app.state.pool.wait_closed()
 
 
 app = FastAPI(title="Books api", lifespan=create_tables)
 
 
 @app.post("/books/add/")
-async def create_book(book: Book):
-    connection = await get_mysql_connection()
+async def create_book(book: Book, request: Request):
     try:
-        cursor: aiomysql.Cursor = await connection.cursor()
-        await cursor.execute(
-            """
-            INSERT INTO books (title, author, description, year, count)
-            VALUES (%s, %s, %s, %s, %s)
-            """,
-            (book.title, book.author, book.description, book.year, book.count)
+        async with request.app.state.pool.acquire() as connection, connection.cursor() as cursor:
+            await cursor.execute(SQL_INSERT_BOOK, (book.title, book.author, book.description, book.year, book.count))
+            return JSONResponse("Book has been added.", status_code=status.HTTP_201_CREATED)
+    except aiomysql.Error as e:
+        raise HTTPException(500, f"Database error {e}")
+
+
+@app.post("/books/add_bulk/", openapi_extra={"requestBody": {
+    "required": True,
+    "content": {"application/json": {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/Book"}}}},
+}})
+async def create_books(request: Request):
+    try:
+        books = BOOK_LIST_ADAPTER.validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
         )
-        await connection.commit()
-        return JSONResponse("Book has been added.", status_code=status.HTTP_201_CREATED)
+    rows = [(book.title, book.author, book.description, book.year, book.count) for book in books]
+    try:
+        async with request.app.state.pool.acquire() as connection, connection.cursor() as cursor:
+            await connection.begin()
+            try:
+                for start in range(0, len(rows), BULK_INSERT_CHUNK):
+                    await cursor.executemany(SQL_INSERT_BOOK, rows[start:start + BULK_INSERT_CHUNK])
+                await connection.commit()
+            except aiomysql.Error:
+                await connection.rollback()
+                raise
+            return JSONResponse(f"{len(rows)} books have been added.", status_code=status.HTTP_201_CREATED)
     except aiomysql.Error as e:
         raise HTTPException(500, f"Database error {e}")
-    finally:
-        if connection is not None:
-            await connection.ensure_closed()
 
 
 @app.post("/events/add/")
-async def create_event(event: Event):
-    connection = await get_mysql_connection()
+async def create_event(event: Event, request: Request):
+    deny_cached_non_admin(event.user, "create")
     try:
-        cursor: aiomysql.Cursor = await connection.cursor()
-        await cursor.execute(
-            """
-            SELECT isadmin FROM users WHERE name = %s;
-            """,
-            (event.user,)
-        )
-        resp = await cursor.fetchone()
-        if isinstance(resp, tuple):
-            if resp[0]:
-                await cursor.execute(
-                    """
-                    INSERT INTO event (title, user, description, time, members)
-                    VALUES (%s, %s, %s, %s, '')
-                    """,
-                    (event.title, event.user, event.description, event.time)
-                )
-            else:
-                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                                    detail='User hasn`t permissions for create event')
-        else:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
-        await connection.commit()
-        return JSONResponse("Event has been added.", status_code=status.HTTP_201_CREATED)
+        async with request.app.state.pool.acquire() as connection, connection.cursor() as cursor:
+            await cursor.execute(SQL_INSERT_EVENT, (event.title, event.user, event.description, event.time, event.user))
+            if not cursor.rowcount:
+                await raise_admin_denial(cursor, event.user, "create")
+            return JSONResponse("Event has been added.", status_code=status.HTTP_201_CREATED)
     except aiomysql.Error as e:
         raise HTTPException(500, f"Database error {e}")
-    finally:
-        if connection is not None:
-            await connection.ensure_closed()
 
 
 @app.post("/users/add/")
-async def create_user(user: User):
-    connection = await get_mysql_connection()
+async def create_user(user: User, request: Request):
+    # argon2 is deliberately slow, so hash in a worker thread instead of blocking the event loop
+    password = await anyio.to_thread.run_sync(PASSWORD_HASHER.hash, user.password)
     try:
-        cursor: aiomysql.Cursor = await connection.cursor()
-        await cursor.execute(
-            """
-            INSERT INTO users (name, surname, email, phone, password, isadmin)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """,
-            (user.name, user.surname, user.email, user.phone, user.password, user.is_admin)
-        )
-        await connection.commit()
-        return JSONResponse("User has been added.", status_code=status.HTTP_201_CREATED)
+        async with request.app.state.pool.acquire() as connection, connection.cursor() as cursor:
+            await cursor.execute(
+                SQL_INSERT_USER, (user.name, user.surname, user.email, user.phone, password, user.is_admin)
+            )
+            return JSONResponse("User has been added.", status_code=status.HTTP_201_CREATED)
     except aiomysql.IntegrityError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
     except aiomysql.Error as e:
         raise HTTPException(500, f"Database error {e}")
-    finally:
-        if connection is not None:
-            await connection.ensure_closed()
 
 
 @app.get("/books/get")
-async def get_all_books():
-    connection = await get_mysql_connection()
+async def get_all_books(request: Request):
     try:
-
-        cursor = await connection.cursor(aiomysql.DictCursor)
-        await cursor.execute("SELECT * FROM books;")
-        resp = await cursor.fetchall()
-        return resp
+        return await stream_rows(request.app.state.pool, SQL_SELECT_BOOKS, BOOK_COLUMNS)
     except aiomysql.Error as e:
         raise HTTPException(500, f"Database error {e}")
-    finally:
-        if connection is not None:
-            await connection.ensure_closed()
 
 
 @app.get("/event/get")
-async def get_all_events():
-    connection = await get_mysql_connection()
+async def get_all_events(request: Request):
     try:
-        cursor = await connection.cursor(aiomysql.DictCursor)
-        await cursor.execute("SELECT * FROM event;")
-        resp = await cursor.fetchall()
-        return resp
+        return await stream_rows(request.app.state.pool, SQL_SELECT_EVENTS, EVENT_COLUMNS)
     except aiomysql.Error as e:
         raise HTTPException(500, f"Database error {e}")
-    finally:
-        if connection is not None:
-            await connection.ensure_closed()
 
 
 @app.get("/books/get/{book_id}")
-async def get_for_id_book(book_id):
-    connection = await get_mysql_connection()
+async def get_for_id_book(request: Request, book_id: int = Path(..., ge=1)):
     try:
-        cursor = await connection.cursor(aiomysql.DictCursor)
-        await cursor.execute("SELECT * FROM books WHERE id = %s;", (book_id,))
-        resp = await cursor.fetchall()
+        resp = await request.app.state.book_loader.load(book_id)
+        if resp is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
         return resp
     except aiomysql.Error as e:
         raise HTTPException(500, f"Database error {e}")
-    finally:
-        if connection is not None:
-            await connection.ensure_closed()
 
 
 @app.get("/event/get/{event_id}")
-async def get_for_id_event(event_id):
-    connection = await get_mysql_connection()
+async def get_for_id_event(request: Request, event_id: int = Path(..., ge=1)):
     try:
-        cursor = await connection.cursor(aiomysql.DictCursor)
-        await cursor.execute("SELECT * FROM event WHERE id = %s;", (event_id,))
-        resp = await cursor.fetchall()
+        resp = await request.app.state.event_loader.load(event_id)
+        if resp is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
         return resp
     except aiomysql.Error as e:
         raise HTTPException(500, f"Database error {e}")
-    finally:
-        if connection is not None:
-            await connection.ensure_closed()
 
 
 @app.put("/event/update/{id}")
-async def update_event(id: int, event: EventEdit):
-    connection = await get_mysql_connection()
+async def update_event(id: int, event: EventEdit, request: Request):
+    deny_cached_non_admin(event.user, "edit")
     try:
-        cursor: aiomysql.Cursor = await connection.cursor()
-        await cursor.execute(
-            """
-            SELECT isadmin FROM users WHERE name = %s;
-            """,
-            (event.user,)
-        )
-        resp = await cursor.fetchone()
-        if isinstance(resp, tuple):
-            if resp[0]:
-                await cursor.execute("""
-                            SELECT id FROM event WHERE id = %s;
-                        """, (id,))
-                check = await cursor.fetchone()
-                if isinstance(check, tuple):
-                    await cursor.execute(
-                        """UPDATE event
-                              SET title = %s, description = %s
-                              WHERE id = %s;""",
-                        (event.title, event.description, id))
-                    await connection.commit()
-                    return JSONResponse("Event has been updated.", status_code=status.HTTP_200_OK)
-                else:
-                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
-            else:
-                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                                    detail='User hasn`t permissions for edit event')
-        else:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
+        async with request.app.state.pool.acquire() as connection, connection.cursor() as cursor:
+            await cursor.execute(SQL_UPDATE_EVENT, (event.user, event.title, event.description, id))
+            if not cursor.rowcount:
+                await raise_admin_denial(cursor, event.user, "edit", id)
+            return JSONResponse("Event has been updated.", status_code=status.HTTP_200_OK)
     except aiomysql.Error as e:
         raise HTTPException(500, f"Database error {e}")
-    finally:
-        if connection is not None:
-            await connection.ensure_closed()
 
 
 @app.patch("/event/update/{id}/reschedule")
-async def update_date(id: int, user: str = Query(...), datetime_: FutureDatetime = Query(...)):
-    connection = await get_mysql_connection()
+async def update_date(request: Request, id: int, user: str = Query(...), datetime_: FutureDatetime = Query(...)):
+    deny_cached_non_admin(user, "edit")
     try:
-        cursor: aiomysql.Cursor = await connection.cursor()
-        await cursor.execute(
-            """
-            SELECT isadmin FROM users WHERE name = %s;
-            """,
-            (user,)
-        )
-        resp = await cursor.fetchone()
-        if isinstance(resp, tuple):
-            if resp[0]:
-                await cursor.execute("""
-                            SELECT id FROM event WHERE id = %s;
-                        """, (id,))
-                check = await cursor.fetchone()
-                if isinstance(check, tuple):
-                    await cursor.execute(
-                        """UPDATE event
-                              SET time = %s
-                              WHERE id = %s;""",
-                        (datetime_, id))
-                    await connection.commit()
-                    return JSONResponse("Event has been updated.", status_code=status.HTTP_200_OK)
-                else:
-                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
-            else:
-                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                                    detail='User hasn`t permissions for edit event')
-        else:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
+        async with request.app.state.pool.acquire() as connection, connection.cursor() as cursor:
+            await cursor.execute(SQL_RESCHEDULE_EVENT, (user, datetime_, id))
+            if not cursor.rowcount:
+                await raise_admin_denial(cursor, user, "edit", id)
+            return JSONResponse("Event has been updated.", status_code=status.HTTP_200_OK)
     except aiomysql.Error as e:
         raise HTTPException(500, f"Database error {e}")
-    finally:
-        if connection is not None:
-            await connection.ensure_closed()
 
 
 @app.patch("/event/update/{id}/rsvp")
-async def update_members(id: int, user: str = Query(...), member_id: int = Query(...)):
-    connection = await get_mysql_connection()
+async def update_members(request: Request, id: int, user: str = Query(...), member_id: int = Query(...)):
+    deny_cached_non_admin(user, "edit")
     try:
-        cursor: aiomysql.Cursor = await connection.cursor()
-        await cursor.execute(
-            """
-            SELECT isadmin FROM users WHERE name = %s;
-            """,
-            (user,)
-        )
-        resp = await cursor.fetchone()
-        if isinstance(resp, tuple):
-            if resp[0]:
-                await cursor.execute("""
-                            SELECT members FROM event WHERE id = %s;
-                        """, (id,))
-                check = await cursor.fetchone()
-                print(check)
-                if isinstance(check, tuple):
-                    await cursor.execute(
-                        """
-                        SELECT id FROM users WHERE id = %s;
-                        """,
-                        (member_id,)
-                    )
-                    answer = await cursor.fetchone()
-                    if isinstance(answer, tuple):
-                        list_ = f"{check[0]}".split(",")
-                        if str(answer[0]) not in list_:
-
-                            await cursor.execute(
-                                """UPDATE event
-                                      SET members = %s
-                                      WHERE id = %s;""",
-                                (f"{check[0]}{member_id},", id))
-                            await connection.commit()
-                            return JSONResponse("Member has been added.", status_code=status.HTTP_201_CREATED)
-                        else:
-                            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Member already registed")
-                    else:
-                        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found")
-                else:
-                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
-            else:
-                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                                    detail='User hasn`t permissions for edit event')
-        else:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
+        async with request.app.state.pool.acquire() as connection, connection.cursor() as cursor:
+            await cursor.execute(SQL_ADD_MEMBER, (member_id, id, user))
+            if not cursor.rowcount:
+                await raise_admin_denial(cursor, user, "edit", id, member_id)
+            return JSONResponse("Member has been added.", status_code=status.HTTP_201_CREATED)
     except aiomysql.Error as e:
         raise HTTPException(500, f"Database error {e}")
-    finally:
-        if connection is not None:
-            await connection.ensure_closed()
 
 
 @app.delete("/event/delete/{event_id}")
-async def delete_event(event_id: int, user: str = Query(...)):
-    connection = await get_mysql_connection()
+async def delete_event(request: Request, event_id: int, user: str = Query(...)):
+    deny_cached_non_admin(user, "delete")
     try:
-        cursor: aiomysql.Cursor = await connection.cursor()
-        await cursor.execute(
-            """
-            SELECT isadmin FROM users WHERE name = %s;
-            """,
-            (user,)
-        )
-        resp = await cursor.fetchall()
-        if isinstance(resp, tuple):
-            if resp[0]:
-                await cursor.execute("""
-                            SELECT id FROM event WHERE id = %s;
-                        """, (event_id,))
-                check = await cursor.fetchone()
-                if isinstance(check, tuple):
-                    await cursor.execute(
-                        """
-                            DELETE FROM event WHERE id = %s;
-                            """,
-                        (event_id,))
-                    await connection.commit()
-                    return JSONResponse("Event has been deleted.", status_code=status.HTTP_201_CREATED)
-                else:
-                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
-            else:
-                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                                    detail='User hasn`t permissions for create event')
-        else:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
+        async with request.app.state.pool.acquire() as connection, connection.cursor() as cursor:
+            await cursor.execute(SQL_DELETE_EVENT, (user, event_id))
+            if not cursor.rowcount:
+                await raise_admin_denial(cursor, user, "delete", event_id)
+            return JSONResponse("Event has been deleted.", status_code=status.HTTP_200_OK)
     except aiomysql.Error as e:
         raise HTTPException(500, f"Database error {e}")
-    finally:
-        if connection is not None:
-            await connection.ensure_closed()
 
 
 if __name__ == "__main__":